@@ -1,94 +1,326 @@
 # app.py
 import os
 import re
-import sys
+import asyncio
+import contextlib
+import hashlib
+import functools
+import shelve
+import string
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import traceback
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from docx.document import Document
 
 # Groq client
-from groq import Groq
-
-# Word & PDF
-from docx import Document
-from docx.shared import Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import ParagraphStyle
+import httpx
+from groq import Groq, AsyncGroq, RateLimitError, APIConnectionError, InternalServerError
+from tenacity import retry, stop_after_attempt, wait_exponential_jitter, retry_if_exception_type
 
 # Gradio UI
 import gradio as gr
 
+# Pooled HTTP/2 keep-alive connections: chapter requests reuse the TLS session and multiplex over it
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=20)
+
 # Initialize Groq client (expect GROQ_API_KEY in env)
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "")
 if not GROQ_API_KEY:
     # we'll still allow UI to run but model calls will return an instructive error
     client = None
 else:
-    client = Groq(api_key=GROQ_API_KEY)
+    # Retries are handled by _retry_transient below, not the SDK.
+    client = Groq(api_key=GROQ_API_KEY, max_retries=0,
+                  http_client=httpx.Client(http2=True, limits=_HTTP_LIMITS))
+# The AsyncGroq client and its httpx.AsyncClient are created per event loop in _agenerate_chapters,
+# since an async connection pool must not outlive the loop that opened it.
+
+# Exponential backoff with jitter for transient Groq failures (429 / 5xx / connection errors).
+# Applied to the raw API calls so safe_model_call's error wrapping doesn't hide the exception type.
+_retry_transient = retry(
+    stop=stop_after_attempt(4),
+    wait=wait_exponential_jitter(1, 10),
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError, InternalServerError)),
+    reraise=True,
+)
+
+
+@_retry_transient
+def _create_completion(**kwargs):
+    return client.chat.completions.create(**kwargs)
 
-# In-memory store
-book_data = {
-    "title": "",
-    "grade": "",
-    "author": "",
-    "developer": "Najaf Ali Sharqi",
-    "medium": "English",
-    "toc": [],         # list of lines like "1. Chapter title"
-    "chapters": {},    # int -> chapter text
-    "preface": ""
-}
+
+@_retry_transient
+async def _acreate_completion(aclient, **kwargs):
+    return await aclient.chat.completions.create(**kwargs)
+
+
+# Upper bound on in-flight Groq requests (keeps us under Groq RPM/TPM limits)
+GROQ_MAX_CONCURRENCY = max(1, int(os.environ.get("GROQ_MAX_CONCURRENCY", "4")))
+# Process-wide: shared by every session, thread and event loop, so N users clicking
+# "Generate All" still keep at most GROQ_MAX_CONCURRENCY Groq requests in flight.
+_GROQ_SLOTS = threading.BoundedSemaphore(GROQ_MAX_CONCURRENCY)
+
+
+@contextlib.asynccontextmanager
+async def _agroq_slot():
+    """Async acquire of a _GROQ_SLOTS slot without blocking the event loop."""
+    while not _GROQ_SLOTS.acquire(blocking=False):
+        await asyncio.sleep(0.05)
+    try:
+        yield
+    finally:
+        _GROQ_SLOTS.release()
+
+# Response cache: exact-match on (model, temperature, system, prompt).
+# Backed by a shelve file so repeated runs survive restarts; falls back to a plain dict.
+_CACHE_PATH = os.environ.get("GROQ_CACHE_PATH", "/tmp/groq_cache.db")
+_CACHE_LOCK = threading.Lock()
+try:
+    _CACHE = shelve.open(_CACHE_PATH, writeback=False)
+except Exception:
+    _CACHE = {}
+
+# Minimum seconds between streamed UI updates
+STREAM_UPDATE_INTERVAL = 0.1
+
+# Default developer credit shown in the UI header and on exports
+DEVELOPER = "Najaf Ali Sharqi"
+
+
+def new_book() -> dict:
+    """Fresh book store. Each browser session holds its own in a gr.State."""
+    return {
+        "title": "",
+        "grade": "",
+        "author": "",
+        "developer": DEVELOPER,
+        "medium": "English",
+        "toc": [],         # list of lines like "1. Chapter title"
+        "toc_by_num": {},  # int -> (original TOC line, title with numbering stripped)
+        "chapters": {},    # int -> chapter text
+        "preface": "",
+        "rev": 0,          # bumped on every mutation; invalidates the cached export document model
+    }
+
+
+def _bump_rev(book: dict):
+    book["rev"] = book.get("rev", 0) + 1
+
+
+# clean_formatting patterns, compiled once.
+# Bold then italic markdown (in that order, so "***a***" and mixed emphasis strip fully);
+# symbols/emojis are dropped with a str.translate deletion table, a C-level per-codepoint
+# lookup that beats a regex character class.
+_RE_BOLD = re.compile(r"\*\*(.*?)\*\*")
+_RE_ITAL = re.compile(r"\*(.*?)\*")
+_JUNK_TABLE = str.maketrans("", "", "#•●→✅🔹🔸📘📖📑📤📥⬇️🎉>")
+_RE_WS = re.compile(r"[ \t]{2,}")
+_RE_NL = re.compile(r"\n{3,}")
+
+# Chapter section headings rendered bold in exports
+_SECTION_RE = re.compile(r"(?i)^(?:student learning outcomes|activities(?: or case studies)?|assessment|post-assessment|glossary)\b")
 
 
 def clean_formatting(text: str) -> str:
     """Remove markdown, emojis and collapse whitespace."""
     if not text:
         return ""
-    text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)
-    text = re.sub(r"\*(.*?)\*", r"\1", text)
+    text = text.replace("\r\n", "\n")
+    text = _RE_BOLD.sub(r"\1", text)
+    text = _RE_ITAL.sub(r"\1", text)
     # remove common symbols/emojis used before
-    text = re.sub(r"[#•●→✅🔹🔸📘📖📑📤📥⬇️🎉>]", "", text)
+    text = text.translate(_JUNK_TABLE)
     # normalize whitespace
-    text = re.sub(r"\r\n", "\n", text)
-    text = re.sub(r"[ \t]{2,}", " ", text)
-    text = re.sub(r"\n{3,}", "\n\n", text)
+    text = _RE_WS.sub(" ", text)
+    text = _RE_NL.sub("\n\n", text)
     return text.strip()
 
 
-def safe_model_call(prompt: str, system: str = None, model: str = "llama3-70b-8192", temperature: float = 0.7):
-    """Call Groq model safely and return string or raise informative error."""
+def _cache_key(prompt: str, system: str, model: str, temperature: float, max_tokens: int = None) -> str:
+    # max_tokens only joins the key when set, so keys for uncapped calls are unchanged
+    limit = f"|{max_tokens}" if max_tokens is not None else ""
+    return hashlib.sha256(f"{model}|{temperature}{limit}|{system or ''}|{prompt}".encode("utf-8")).hexdigest()
+
+
+@functools.lru_cache(maxsize=256)
+def _cache_get(key: str) -> str:
+    """Return cached response text for key; raises KeyError on miss (misses are not memoized)."""
+    with _CACHE_LOCK:
+        return _CACHE[key]
+
+
+def _cache_put(key: str, text: str):
+    with _CACHE_LOCK:
+        _CACHE[key] = text
+        if hasattr(_CACHE, "sync"):
+            _CACHE.sync()
+
+
+def clear_cache():
+    """Drop all cached model responses (memory and disk)."""
+    with _CACHE_LOCK:
+        _CACHE.clear()
+    _cache_get.cache_clear()
+    return "Model response cache cleared."
+
+
+def _build_messages(prompt: str, system: str = None) -> list:
+    messages = []
+    if system:
+        messages.append({"role": "system", "content": system})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def _stream_model_call(key: str, messages: list, model: str, temperature: float, max_tokens: int = None):
+    """Generator yielding response text deltas as they arrive; caches the full text at the end."""
+    try:
+        yield _cache_get(key)
+        return
+    except KeyError:
+        pass
     if client is None:
         raise RuntimeError("GROQ_API_KEY not found in environment. Set GROQ_API_KEY before calling the model.")
+    parts = []
+    # the slot is held until the stream is fully consumed (or the generator is closed)
+    with _GROQ_SLOTS:
+        try:
+            kwargs = {"max_tokens": max_tokens} if max_tokens is not None else {}
+            stream = _create_completion(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                stream=True,
+                **kwargs
+            )
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content or ""
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            tb = traceback.format_exc()
+            raise RuntimeError(f"Model call failed: {e}\n{tb}")
+    text = "".join(parts)
+    if text:
+        _cache_put(key, text)
+
+
+def safe_model_call(prompt: str, system: str = None, model: str = "llama3-70b-8192", temperature: float = 0.7, stream: bool = False,
+                    max_tokens: int = None):
+    """Call Groq model safely and return string or raise informative error.
+
+    With stream=True, return a generator of text deltas instead of the full string.
+    max_tokens caps the completion length.
+    """
+    key = _cache_key(prompt, system, model, temperature, max_tokens)
+    if stream:
+        messages = _build_messages(prompt, system)
+        return _stream_model_call(key, messages, model, temperature, max_tokens)
     try:
-        messages = []
-        if system:
-            messages.append({"role": "system", "content": system})
-        messages.append({"role": "user", "content": prompt})
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature
-        )
-        return response.choices[0].message.content
+        return _cache_get(key)
+    except KeyError:
+        pass
+    if client is None:
+        raise RuntimeError("GROQ_API_KEY not found in environment. Set GROQ_API_KEY before calling the model.")
+    try:
+        messages = _build_messages(prompt, system)
+        kwargs = {"max_tokens": max_tokens} if max_tokens is not None else {}
+        with _GROQ_SLOTS:
+            response = _create_completion(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                **kwargs
+            )
+        text = response.choices[0].message.content
     except Exception as e:
         tb = traceback.format_exc()
         raise RuntimeError(f"Model call failed: {e}\n{tb}")
+    if text:
+        _cache_put(key, text)
+    return text
+
+
+async def async_safe_model_call(aclient, prompt: str, system: str = None, model: str = "llama3-70b-8192", temperature: float = 0.7,
+                                max_tokens: int = None):
+    """Async counterpart of safe_model_call, used to fan out chapter requests concurrently.
+
+    aclient is the AsyncGroq client bound to the running event loop (None when no API key is set).
+    """
+    key = _cache_key(prompt, system, model, temperature, max_tokens)
+    try:
+        return _cache_get(key)
+    except KeyError:
+        pass
+    if aclient is None:
+        raise RuntimeError("GROQ_API_KEY not found in environment. Set GROQ_API_KEY before calling the model.")
+    try:
+        messages = _build_messages(prompt, system)
+        kwargs = {"max_tokens": max_tokens} if max_tokens is not None else {}
+        async with _agroq_slot():
+            response = await _acreate_completion(
+                aclient,
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                **kwargs
+            )
+        text = response.choices[0].message.content
+    except Exception as e:
+        tb = traceback.format_exc()
+        raise RuntimeError(f"Model call failed: {e}\n{tb}")
+    if text:
+        _cache_put(key, text)
+    return text
+
+
+def _accumulate(deltas):
+    """Yield the growing text built from streamed deltas, throttled to STREAM_UPDATE_INTERVAL."""
+    text = ""
+    last = 0.0
+    for delta in deltas:
+        text += delta
+        now = time.monotonic()
+        if now - last >= STREAM_UPDATE_INTERVAL:
+            last = now
+            yield text
+    yield text
+
+
+_TOC_HEADING = "table of contents"
+_TOC_HEADING_RE = re.compile(r"table of contents", re.IGNORECASE)
+_CH1_RE = re.compile(r"(?mi)^(Chapter\s*1|1\.)")
 
 
 def parse_preface_and_toc(raw_output: str):
     """Try to split model output into preface and Table of Contents robustly."""
     if not raw_output:
         return "", []
-    # Search for a line that starts "Table of Contents" case-insensitively
-    m = re.search(r"Table of Contents", raw_output, re.IGNORECASE)
-    if m:
-        preface_part = raw_output[:m.start()].strip()
-        toc_part = raw_output[m.end():].strip()
+    # Search for "Table of Contents" case-insensitively; a plain find on the lowercased text
+    # is much cheaper than an IGNORECASE regex. Only valid while lower() keeps offsets aligned.
+    i = -1
+    lower = raw_output.lower()
+    if len(lower) == len(raw_output):
+        i = lower.find(_TOC_HEADING)
+    else:
+        m = _TOC_HEADING_RE.search(raw_output)
+        if m:
+            i = m.start()
+    if i != -1:
+        preface_part = raw_output[:i].strip()
+        toc_part = raw_output[i + len(_TOC_HEADING):].strip()
     else:
         # fallback: attempt to heuristically split on 'Chapter 1' or similar
-        m2 = re.search(r"(?mi)^(Chapter\s*1|1\.)", raw_output)
+        m2 = _CH1_RE.search(raw_output)
         if m2:
             preface_part = raw_output[:m2.start()].strip()
             toc_part = raw_output[m2.start():].strip()
@@ -105,7 +337,7 @@ def parse_preface_and_toc(raw_output: str):
             if not line:
                 continue
             # If the model included "Table of Contents" header in the remaining text, skip it
-            if re.match(r"^\s*Table of Contents\s*$", line, re.IGNORECASE):
+            if line.lower() == _TOC_HEADING:
                 continue
             toc_lines.append(line)
     else:
@@ -115,14 +347,14 @@ def parse_preface_and_toc(raw_output: str):
     return clean_formatting(preface_part), [clean_formatting(l) for l in toc_lines]
 
 
-def generate_book_intro(title: str, grade: str, author: str, medium: str):
-    """Generate preface and initial TOC using model."""
+def generate_book_intro(book: dict, title: str, grade: str, author: str, medium: str):
+    """Generate preface and initial TOC using model; yields (book, text)."""
     title = (title or "").strip()
     grade = (grade or "").strip()
     author = (author or "").strip()
     medium = medium or "English"
 
-    book_data.update({"title": title, "grade": grade, "author": author, "medium": medium})
+    book.update({"title": title, "grade": grade, "author": author, "medium": medium})
 
     prompt = f"""
 You are an expert Pakistani educational textbook author. Language/medium: {medium}.
@@ -134,41 +366,65 @@ Return the Preface followed by a heading 'Table of Contents' and then the 7 line
 Do NOT produce chapter bodies.
 """
     try:
-        raw_out = safe_model_call(prompt)
+        raw_out = ""
+        for raw_out in _accumulate(safe_model_call(prompt, stream=True)):
+            yield book, clean_formatting(raw_out)
         preface, toc = parse_preface_and_toc(raw_out)
-        book_data["preface"] = preface
-        book_data["toc"] = toc
+        book["preface"] = preface
+        book["toc"] = toc
+        book["toc_by_num"] = _index_toc(toc)
         # clear any previously generated chapters
-        book_data["chapters"] = {}
-        return f"Preface:\n\n{preface}\n\nTable of Contents:\n\n" + "\n".join(toc)
+        book["chapters"] = {}
+        _bump_rev(book)
+        yield book, f"Preface:\n\n{preface}\n\nTable of Contents:\n\n" + "\n".join(toc)
     except Exception as e:
-        return f"Error generating book intro: {e}"
+        yield book, f"Error generating book intro: {e}"
 
 
-def generate_chapter(ch_num):
-    """Generate one chapter (with SLOs, aligned content, examples, glossary, 10 MCQs)."""
-    try:
-        ch_index = int(ch_num)
-    except Exception:
-        return "Invalid chapter number."
+_TOC_NUM_RE = re.compile(r"(?i)^\s*(?:chapter\s*)?(\d+)(?:[\.\-\:\s]|$)")
+# both prefixes are optional and may stack, e.g. "1. Chapter 1: Title"
+_TOC_PREFIX_RE = re.compile(r"(?i)^\s*(?:\d+(?:[\s\.\-\:]+|$))?(?:chapter\s*\d+(?:[\s\.\-\:]+|$))?")
 
-    if ch_index in book_data["chapters"]:
-        return book_data["chapters"][ch_index]
 
-    # obtain chapter title from toc if present
-    ch_title = f"Chapter {ch_index}"
-    if 1 <= ch_index <= len(book_data.get("toc", [])):
-        # strip leading numbering if present
-        raw = book_data["toc"][ch_index - 1]
+def _index_toc(toc: list) -> dict:
+    """
+    Map chapter number -> (original TOC line, title with numbering stripped).
+    Prompts use the title and exporters the original line, so both agree on which line is chapter N.
+    Lines with an explicit number are keyed by it; stray unnumbered lines (e.g. a leftover ":" after
+    the "Table of Contents" heading) are dropped. Only a TOC with no numbers at all falls back to
+    line position.
+    """
+    numbered = []
+    for line in toc:
+        m = _TOC_NUM_RE.match(line)
+        if m:
+            numbered.append((int(m.group(1)), line))
+    if not numbered:
+        numbered = list(enumerate(toc, start=1))
+
+    by_num = {}
+    for num, line in numbered:
         # remove '1.' or 'Chapter 1 -' prefixes
-        raw = re.sub(r"^\s*\d+[\.\-\:]\s*", "", raw)
-        raw = re.sub(r"(?i)^chapter\s*\d+[\.\-\:]*\s*", "", raw)
-        ch_title = raw.strip() or ch_title
+        title = _TOC_PREFIX_RE.sub("", line).strip()
+        by_num.setdefault(num, (line, title or f"Chapter {num}"))
+    return by_num
+
+
+def _chapter_title(book: dict, ch_index: int) -> str:
+    """Chapter title from the TOC with any leading numbering removed."""
+    entry = book.get("toc_by_num", {}).get(ch_index)
+    return entry[1] if entry else f"Chapter {ch_index}"
 
-    prompt = f"""
-You are an expert Pakistani textbook writer. Medium: {book_data['medium']}.
-Write Chapter {ch_index}: "{ch_title}" for the textbook titled "{book_data['title']}" (Grade {book_data['grade']}) by {book_data['author']}.
-Structure the chapter exactly with these sections (in this order):
+
+def _chapter_numbers(book: dict) -> list:
+    """Chapter numbers listed in the TOC (chapter 1 alone when there is no TOC yet)."""
+    return sorted(book.get("toc_by_num") or {}) or [1]
+
+
+# Chapter writing instructions shared by the per-chapter and batched prompts.
+_CHAPTER_INSTRUCTIONS = """
+You are an expert Pakistani textbook writer.
+Structure each chapter exactly with these sections (in this order):
 
 1. Student Learning Outcomes (5 to 7 short SLO statements).
 2. For each SLO, provide detailed content aligned to that SLO. For every concept include:
@@ -180,34 +436,204 @@ Structure the chapter exactly with these sections (in this order):
 5. Post-assessment: 10 MCQs (without answers). Make them beginner-level and relevant to Pakistan context.
 
 Styling notes: no markdown, no emojis. Use clear simple language for absolute beginners. Keep each section labeled (e.g., "Student Learning Outcomes:").
-Return the whole chapter as plain text.
 """
+
+# Chapter prompt: the long static instruction block comes first and is byte-identical for every
+# chapter, so requests share the longest possible prefix (server-side prompt/KV caching);
+# the per-book and per-chapter fields come last.
+_CHAPTER_TEMPLATE = string.Template(_CHAPTER_INSTRUCTIONS + """Return the whole chapter as plain text.
+
+Medium: $medium.
+Textbook: "$title" (Grade $grade) by $author.
+Write Chapter $ch_index: "$ch_title".
+""")
+
+
+def _chapter_prompt(book: dict, ch_index: int) -> str:
+    """Build the chapter-generation prompt for chapter number ch_index."""
+    return _CHAPTER_TEMPLATE.substitute(
+        medium=book["medium"],
+        title=book["title"],
+        grade=book["grade"],
+        author=book["author"],
+        ch_index=ch_index,
+        ch_title=_chapter_title(book, ch_index),
+    )
+
+
+def generate_chapter(book: dict, ch_num):
+    """Generate one chapter (with SLOs, aligned content, examples, glossary, 10 MCQs).
+
+    Yields (book, partial chapter text) as tokens stream in.
+    """
+    try:
+        ch_index = int(ch_num)
+    except Exception:
+        yield book, "Invalid chapter number."
+        return
+
+    if ch_index in book["chapters"]:
+        yield book, book["chapters"][ch_index]
+        return
+
+    prompt = _chapter_prompt(book, ch_index)
+    try:
+        raw_out = ""
+        for raw_out in _accumulate(safe_model_call(prompt, stream=True)):
+            yield book, clean_formatting(raw_out)
+        chapter_text = clean_formatting(raw_out)
+        book["chapters"][ch_index] = chapter_text
+        _bump_rev(book)
+        yield book, chapter_text
+    except Exception as e:
+        yield book, f"Error generating chapter: {e}"
+
+
+async def _achapter(aclient, book: dict, ch_index: int) -> str:
+    """Async variant of generate_chapter; concurrency is bounded process-wide by _GROQ_SLOTS."""
+    prompt = _chapter_prompt(book, ch_index)
     try:
-        raw_out = safe_model_call(prompt)
+        raw_out = await async_safe_model_call(aclient, prompt)
         chapter_text = clean_formatting(raw_out)
-        book_data["chapters"][ch_index] = chapter_text
+        book["chapters"][ch_index] = chapter_text
+        _bump_rev(book)
         return chapter_text
     except Exception as e:
         return f"Error generating chapter: {e}"
 
 
-def generate_all_chapters():
-    """Generate all chapters according to current TOC length (default 7)."""
+def _async_client():
+    """AsyncGroq client for the running event loop, as an async context manager (None without a key)."""
+    if not GROQ_API_KEY:
+        return contextlib.nullcontext()
+    return AsyncGroq(api_key=GROQ_API_KEY, max_retries=0,
+                     http_client=httpx.AsyncClient(http2=True, limits=_HTTP_LIMITS))
+
+
+async def _agenerate_chapters(book: dict, indices):
+    """
+    Generate the given chapters concurrently on the current event loop.
+    Each asyncio.run() owns a fresh loop that is closed afterwards, so the AsyncGroq client and its
+    connection pool are created here and closed with the loop rather than shared at module level.
+    """
+    async with _async_client() as aclient:
+        return await asyncio.gather(*[_achapter(aclient, book, i) for i in indices])
+
+
+def generate_all_chapters(book: dict):
+    """Generate all chapters listed in the TOC (default 7), concurrently; returns (book, log)."""
+    numbers = _chapter_numbers(book)
+    pending = [i for i in numbers if i not in book["chapters"]]
+    errors = {}
+    if pending:
+        for i, text in zip(pending, asyncio.run(_agenerate_chapters(book, pending))):
+            if i not in book["chapters"]:
+                errors[i] = text
+
     results = []
-    total = max(1, len(book_data.get("toc") or []))
-    for i in range(1, total + 1):
+    for i in numbers:
         results.append(f"Generating Chapter {i}...")
-        chapter_text = generate_chapter(i)
+        chapter_text = book["chapters"].get(i) or errors.get(i, "")
         results.append(chapter_text[:1000] + ("..." if len(chapter_text) > 1000 else ""))
-    return "\n\n".join(results)
+    return book, "\n\n".join(results)
+
+
+_BATCH_CHAPTER_RE = re.compile(r"===CHAPTER_(\d+)_START===\s*\n(.*?)\n\s*===CHAPTER_\1_END===", re.DOTALL)
+
+# Token budget for batched requests. The default model (llama3-70b-8192) has an 8k context shared by
+# prompt and completion, and one full chapter (content + glossary + 10 MCQs) runs ~2.5k tokens,
+# so only a couple of chapters fit per request.
+MODEL_CONTEXT_TOKENS = int(os.environ.get("MODEL_CONTEXT_TOKENS", "8192"))
+CHAPTER_TOKEN_ESTIMATE = int(os.environ.get("CHAPTER_TOKEN_ESTIMATE", "2500"))
+BATCH_PROMPT_TOKEN_ESTIMATE = 800
+BATCH_MAX_CHAPTERS = max(1, (MODEL_CONTEXT_TOKENS - BATCH_PROMPT_TOKEN_ESTIMATE) // CHAPTER_TOKEN_ESTIMATE)
+
+
+def _batched_prompt(book: dict, group: list) -> str:
+    chapter_list = "\n".join(f"Chapter {i}: \"{_chapter_title(book, i)}\"" for i in group)
+    return _CHAPTER_INSTRUCTIONS + f"""Wrap chapter k exactly as follows, each marker on its own line:
+===CHAPTER_k_START===
+(chapter text)
+===CHAPTER_k_END===
+Return only the wrapped chapters as plain text.
+
+Medium: {book['medium']}.
+Textbook: "{book['title']}" (Grade {book['grade']}) by {book['author']}.
+Write the following chapters:
+{chapter_list}
+"""
+
+
+async def _agenerate_batches(book: dict, groups: list):
+    """Send every batch request concurrently; failed requests come back as exceptions."""
+    async with _async_client() as aclient:
+        return await asyncio.gather(
+            *[async_safe_model_call(aclient, _batched_prompt(book, group),
+                                    max_tokens=len(group) * CHAPTER_TOKEN_ESTIMATE)
+              for group in groups],
+            return_exceptions=True,
+        )
+
+
+def generate_all_chapters_batched(book: dict):
+    """
+    Generate pending chapters with as few model requests as the context window allows: chapters are
+    grouped BATCH_MAX_CHAPTERS per request, the groups are sent concurrently, and each response is split
+    on sentinel markers. Chapters a request skipped, truncated or failed on fall back to
+    generate_all_chapters. Returns (book, log).
+    """
+    pending = [i for i in _chapter_numbers(book) if i not in book["chapters"]]
+    groups = [pending[start:start + BATCH_MAX_CHAPTERS] for start in range(0, len(pending), BATCH_MAX_CHAPTERS)]
+    batched, notes = [], []
+    responses = asyncio.run(_agenerate_batches(book, groups)) if groups else []
+    for group, raw_out in zip(groups, responses):
+        if isinstance(raw_out, Exception):
+            notes.append(f"Batch for chapters {', '.join(map(str, group))} failed: {str(raw_out).splitlines()[0]}")
+            continue
+        for m in _BATCH_CHAPTER_RE.finditer(raw_out or ""):
+            ch_index = int(m.group(1))
+            if ch_index in group and ch_index not in book["chapters"]:
+                book["chapters"][ch_index] = clean_formatting(m.group(2))
+                batched.append(ch_index)
+        _bump_rev(book)
+
+    fallback = [i for i in pending if i not in book["chapters"]]
+    summary = [
+        f"Batched ({BATCH_MAX_CHAPTERS} per request): chapters {', '.join(map(str, batched)) or 'none'}",
+        f"Fell back to per-chapter requests: chapters {', '.join(map(str, fallback)) or 'none'}",
+    ] + notes
+    # fills in anything the batched responses did not cover and builds the log
+    book, log = generate_all_chapters(book)
+    return book, "\n".join(summary) + "\n\n" + log
 
 
 # --- Word export helpers ---
-def _add_centered_paragraph(doc: Document, text: str, size: int = 12, bold: bool = False):
+# python-docx and reportlab are imported on first export, keeping them off the UI startup path.
+@functools.lru_cache(maxsize=1)
+def _docx_mod():
+    from docx import Document
+    from docx.shared import Pt
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.oxml import OxmlElement, parse_xml
+    from docx.oxml.ns import qn
+    return SimpleNamespace(Document=Document, Pt=Pt, WD_ALIGN_PARAGRAPH=WD_ALIGN_PARAGRAPH,
+                           OxmlElement=OxmlElement, parse_xml=parse_xml, qn=qn)
+
+
+@functools.lru_cache(maxsize=1)
+def _reportlab_mod():
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+    from reportlab.lib.styles import ParagraphStyle
+    return SimpleNamespace(A4=A4, SimpleDocTemplate=SimpleDocTemplate, Paragraph=Paragraph,
+                           Spacer=Spacer, PageBreak=PageBreak, ParagraphStyle=ParagraphStyle)
+
+
+def _add_paragraph(doc: "Document", text: str, size: int, bold: bool, alignment):
     p = doc.add_paragraph()
-    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    p.alignment = alignment
     run = p.add_run(text)
-    run.font.size = Pt(size)
+    run.font.size = _docx_mod().Pt(size)
     run.bold = bold
     try:
         run.font.name = "Times New Roman"
@@ -217,71 +643,181 @@ def _add_centered_paragraph(doc: Document, text: str, size: int = 12, bold: bool
     return p
 
 
-def _add_left_paragraph(doc: Document, text: str, size: int = 12, bold: bool = False):
-    p = doc.add_paragraph()
-    p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-    run = p.add_run(text)
-    run.font.size = Pt(size)
-    run.bold = bold
-    try:
-        run.font.name = "Times New Roman"
-    except Exception:
-        pass
-    p.paragraph_format.line_spacing = 1.5
+def _add_centered_paragraph(doc: "Document", text: str, size: int = 12, bold: bool = False):
+    return _add_paragraph(doc, text, size, bold, _docx_mod().WD_ALIGN_PARAGRAPH.CENTER)
+
+
+def _add_left_paragraph(doc: "Document", text: str, size: int = 12, bold: bool = False):
+    return _add_paragraph(doc, text, size, bold, _docx_mod().WD_ALIGN_PARAGRAPH.LEFT)
+
+
+def _body_append(body, element):
+    """Append a block element to the document body, keeping sectPr as its last child."""
+    sectPr = body.sectPr
+    if sectPr is not None:
+        sectPr.addprevious(element)
+    else:
+        body.append(element)
+
+
+def _fast_para(body, text: str, OxmlElement, qn, bold: bool = False, center: bool = False, size_pt: int = 12):
+    """
+    Append a paragraph straight to the document body XML.
+    Equivalent to _add_left_paragraph/_add_centered_paragraph but skips the python-docx object layer,
+    which dominates export time on long chapters. OxmlElement and qn are passed in so the
+    per-line loop doesn't resolve them for every paragraph.
+    """
+    p = OxmlElement('w:p')
+    pPr = OxmlElement('w:pPr')
+    spacing = OxmlElement('w:spacing')
+    spacing.set(qn('w:line'), '360')  # 1.5 line spacing
+    spacing.set(qn('w:lineRule'), 'auto')
+    pPr.append(spacing)
+    jc = OxmlElement('w:jc')
+    jc.set(qn('w:val'), 'center' if center else 'left')
+    pPr.append(jc)
+    p.append(pPr)
+
+    r = OxmlElement('w:r')
+    rPr = OxmlElement('w:rPr')
+    fonts = OxmlElement('w:rFonts')
+    fonts.set(qn('w:ascii'), 'Times New Roman')
+    fonts.set(qn('w:hAnsi'), 'Times New Roman')
+    rPr.append(fonts)
+    if bold:
+        rPr.append(OxmlElement('w:b'))
+    sz = OxmlElement('w:sz')
+    sz.set(qn('w:val'), str(size_pt * 2))  # half-points
+    rPr.append(sz)
+    r.append(rPr)
+    t = OxmlElement('w:t')
+    t.set(qn('xml:space'), 'preserve')
+    t.text = text
+    r.append(t)
+    p.append(r)
+
+    _body_append(body, p)
     return p
 
 
-def _insert_word_toc(doc: Document):
+# Word TOC field as one paragraph: begin/instr/separate, an "update me" placeholder run, end.
+# Word replaces the placeholder when the user updates fields (References -> Update Table).
+_TOC_XML = (
+    '<w:p xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:r><w:fldChar w:fldCharType="begin"/>'
+    '<w:instrText xml:space="preserve">TOC \\o "1-3" \\h \\z \\u</w:instrText>'
+    '<w:fldChar w:fldCharType="separate"/></w:r>'
+    '<w:r><w:rPr><w:sz w:val="20"/></w:rPr>'
+    '<w:t xml:space="preserve">Right-click the table and choose \'Update Field\' to populate page numbers.</w:t></w:r>'
+    '<w:r><w:fldChar w:fldCharType="end"/></w:r>'
+    '</w:p>'
+)
+
+
+def _insert_word_toc(doc: "Document"):
     """
     Insert a Word Table of Contents field. Word will populate page numbers when user updates fields (References -> Update Table).
     This is the practical way to provide a final TOC with page numbers for .docx files.
     """
-    paragraph = doc.add_paragraph()
-    run = paragraph.add_run()
-    fldChar = OxmlElement('w:fldChar')
-    fldChar.set(qn('w:fldCharType'), 'begin')
-    run._r.append(fldChar)
-
-    instrText = OxmlElement('w:instrText')
-    instrText.set(qn('xml:space'), 'preserve')
     # TOC field to include levels 1-3, use hyperlinks, hide tab leader in web layout
-    instrText.text = 'TOC \\o "1-3" \\h \\z \\u'
-    run._r.append(instrText)
+    _body_append(doc.element.body, _docx_mod().parse_xml(_TOC_XML))
 
-    fldChar2 = OxmlElement('w:fldChar')
-    fldChar2.set(qn('w:fldCharType'), 'separate')
-    run._r.append(fldChar2)
 
-    # A "please update" placeholder that Word will replace
-    run2 = paragraph.add_run("Right-click the table and choose 'Update Field' to populate page numbers.")
-    run2.font.size = Pt(10)
-
-    fldChar3 = OxmlElement('w:fldChar')
-    fldChar3.set(qn('w:fldCharType'), 'end')
-    run._r.append(fldChar3)
-
-
-def export_book_word():
+def _build_doc_model(book: dict):
+    """
+    Normalize book into the block structure both exporters render:
+    (preface, toc_lines, ((chapter_title, ((kind, text), ...)), ...)) with kind in {"header", "body"}.
+    """
+    # chapter headings come from the same number-keyed map the prompts use
+    toc_by_num = book.get("toc_by_num", {})
+    toc = tuple(toc_by_num[num][0] for num in sorted(toc_by_num))
+    chapters = []
+    for num in sorted(book.get("chapters", {}).keys()):
+        entry = toc_by_num.get(num)
+        title_line = entry[0] if entry else f"Chapter {num}"
+        # non-empty stripped lines first, then classify them in one pass; splitlines() also breaks on
+        # \r, \x0b, \x0c, \x85 and \u2028, so no control characters reach the Word XML
+        lines = [ln for ln in (raw.strip() for raw in book["chapters"][num].splitlines()) if ln]
+        # mark section headers (Student Learning Outcomes, Activities, Glossary, Assessment)
+        header_flags = [bool(_SECTION_RE.match(ln)) for ln in lines]
+        blocks = tuple(("header" if is_header else "body", ln) for ln, is_header in zip(lines, header_flags))
+        chapters.append((title_line, blocks))
+    return book.get("preface", ""), toc, tuple(chapters)
+
+
+def _doc_model(book: dict):
+    """Document model for book, cached on the book's rev so Word and PDF exports classify lines once."""
+    cached = book.get("_doc_model")
+    if cached is None or cached[0] != book["rev"]:
+        cached = (book["rev"], _build_doc_model(book))
+        book["_doc_model"] = cached
+    return cached[1]
+
+
+# All exports land in one app-owned directory; old files are pruned so a long-running
+# container doesn't accumulate one file per click.
+_EXPORT_DIR = os.path.join(tempfile.gettempdir(), "textbook_exports")
+EXPORT_MAX_FILES = 50
+EXPORT_MAX_AGE_SECONDS = 3600
+
+
+def _prune_exports():
+    """Delete exports older than EXPORT_MAX_AGE_SECONDS, and the oldest beyond EXPORT_MAX_FILES."""
+    try:
+        entries = sorted(
+            (e for e in os.scandir(_EXPORT_DIR) if e.is_file()),
+            key=lambda e: e.stat().st_mtime,
+            reverse=True,
+        )
+    except OSError:
+        return
+    cutoff = time.time() - EXPORT_MAX_AGE_SECONDS
+    for n, entry in enumerate(entries):
+        try:
+            if n >= EXPORT_MAX_FILES or entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _export_path(suffix: str) -> str:
+    """Unique output path per export, so concurrent sessions never overwrite each other's files."""
+    os.makedirs(_EXPORT_DIR, exist_ok=True)
+    _prune_exports()
+    with tempfile.NamedTemporaryFile(delete=False, dir=_EXPORT_DIR, prefix="Textbook_AI_Generated_", suffix=suffix) as f:
+        return f.name
+
+
+def export_book_word(book: dict):
     """Create a .docx file and return path."""
     try:
-        doc = Document()
+        # book-level constants, bound once
+        preface, _toc, chapters = _doc_model(book)
+        title = book.get("title", "")
+        grade = book.get("grade", "")
+        author = book.get("author", "")
+        developer = book.get("developer", "")
+        date_str = datetime.now().strftime('%B %d, %Y')
+
+        dx = _docx_mod()
+        doc = dx.Document()
         doc.styles['Normal'].font.name = 'Times New Roman'
-        doc.styles['Normal'].font.size = Pt(12)
+        doc.styles['Normal'].font.size = dx.Pt(12)
 
         # Developer at top center
-        _add_centered_paragraph(doc, book_data.get("developer", ""), size=12, bold=True)
+        _add_centered_paragraph(doc, developer, size=12, bold=True)
 
         # Title page
-        _add_centered_paragraph(doc, book_data.get("title", ""), size=18, bold=True)
-        _add_centered_paragraph(doc, f"Grade: {book_data.get('grade','')}", size=12)
-        _add_centered_paragraph(doc, f"Author: {book_data.get('author','')}", size=12)
-        _add_centered_paragraph(doc, f"Developed by: {book_data.get('developer','')}", size=12)
-        _add_centered_paragraph(doc, f"Date: {datetime.now().strftime('%B %d, %Y')}", size=12)
+        _add_centered_paragraph(doc, title, size=18, bold=True)
+        _add_centered_paragraph(doc, f"Grade: {grade}", size=12)
+        _add_centered_paragraph(doc, f"Author: {author}", size=12)
+        _add_centered_paragraph(doc, f"Developed by: {developer}", size=12)
+        _add_centered_paragraph(doc, f"Date: {date_str}", size=12)
         doc.add_page_break()
 
         # Preface
         _add_centered_paragraph(doc, "Preface", size=12, bold=True)
-        _add_left_paragraph(doc, book_data.get("preface", ""))
+        _add_left_paragraph(doc, preface)
         doc.add_page_break()
 
         # Table of Contents (field)
@@ -290,76 +826,99 @@ def export_book_word():
         doc.add_page_break()
 
         # Chapters
-        for num in sorted(book_data.get("chapters", {}).keys()):
-            # chapter title: take from toc if available
-            title_line = book_data["toc"][num - 1] if 0 <= num - 1 < len(book_data.get("toc", [])) else f"Chapter {num}"
+        body = doc.element.body
+        fast_para = _fast_para
+        OxmlElement, qn = dx.OxmlElement, dx.qn
+        add_page_break = doc.add_page_break
+        for title_line, blocks in chapters:
             # chapter heading as 12 bold center (per your spec for subheadings)
-            _add_centered_paragraph(doc, title_line, size=12, bold=True)
-            # write the chapter lines
-            for line in book_data["chapters"][num].splitlines():
-                stripped = line.strip()
-                if not stripped:
-                    continue
-                # mark section headers (Student Learning Outcomes, Activities, Glossary, Assessment) as bold left
-                if re.match(r"(?i)^(student learning outcomes|activities|assessment|glossary|post-assessment|activities or case studies)\b", stripped):
-                    _add_left_paragraph(doc, stripped, size=12, bold=True)
-                else:
-                    _add_left_paragraph(doc, stripped, size=12, bold=False)
-            doc.add_page_break()
-
-        out_path = "/tmp/Textbook_AI_Generated.docx"
+            fast_para(body, title_line, OxmlElement, qn, bold=True, center=True)
+            # write the chapter lines; section headers as bold left
+            for kind, text in blocks:
+                fast_para(body, text, OxmlElement, qn, bold=(kind == "header"))
+            add_page_break()
+
+        out_path = _export_path(".docx")
         doc.save(out_path)
         return out_path
     except Exception as e:
         return f"Error exporting Word: {e}\n{traceback.format_exc()}"
 
 
-def export_book_pdf():
+# ReportLab Paragraph text is mini-markup; escape it in one C-level pass per line
+_PDF_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+
+def _pdf_story(book, preface, toc, chapters, normal, heading_center, subheading):
+    """Yield the PDF flowables in reading order."""
+    # book-level constants and hot names, bound once
+    rl = _reportlab_mod()
+    esc = _PDF_ESCAPE
+    para = rl.Paragraph
+    Spacer, PageBreak = rl.Spacer, rl.PageBreak
+    title = book.get("title", "")
+    grade = book.get("grade", "")
+    author = book.get("author", "")
+    developer = book.get("developer", "")
+    date_str = datetime.now().strftime('%B %d, %Y')
+
+    # Developer and title
+    yield para(developer.translate(esc), subheading)
+    yield para(title.translate(esc), heading_center)
+    yield Spacer(1, 12)
+    yield para(f"Grade: {grade}".translate(esc), normal)
+    yield para(f"Author: {author}".translate(esc), normal)
+    yield para(f"Date: {date_str}", normal)
+    yield PageBreak()
+
+    # Preface
+    yield para("Preface", subheading)
+    yield para(preface.translate(esc), normal)
+    yield PageBreak()
+
+    # TOC (no automatic page numbers in this PDF)
+    yield para("Table of Contents (open the Word .docx to get page-numbered TOC)", subheading)
+    for line in toc:
+        yield para(line.translate(esc), normal)
+    yield PageBreak()
+
+    # Chapters
+    for title_line, blocks in chapters:
+        yield para(title_line.translate(esc), subheading)
+        for kind, text in blocks:
+            # section headers use the same bold style as in the Word export
+            yield para(text.translate(esc), subheading if kind == "header" else normal)
+        yield PageBreak()
+
+
+def export_book_pdf(book: dict):
     """Create a PDF (simpler TOC — Word is recommended for final page-numbered TOC)."""
     try:
-        out_path = "/tmp/Textbook_AI_Generated.pdf"
-        doc = SimpleDocTemplate(out_path, pagesize=A4)
-        normal = ParagraphStyle("Normal", fontName="Times-Roman", fontSize=12, leading=18)
-        heading_center = ParagraphStyle("HCenter", fontName="Times-Bold", fontSize=18, leading=22, alignment=1)
-        subheading = ParagraphStyle("Sub", fontName="Times-Bold", fontSize=12, leading=16)
-
-        story = []
-        # Developer and title
-        story.append(Paragraph(book_data.get("developer", ""), subheading))
-        story.append(Paragraph(book_data.get("title", ""), heading_center))
-        story.append(Spacer(1, 12))
-        story.append(Paragraph(f"Grade: {book_data.get('grade','')}", normal))
-        story.append(Paragraph(f"Author: {book_data.get('author','')}", normal))
-        story.append(Paragraph(f"Date: {datetime.now().strftime('%B %d, %Y')}", normal))
-        story.append(PageBreak())
-
-        # Preface
-        story.append(Paragraph("Preface", subheading))
-        story.append(Paragraph(book_data.get("preface", ""), normal))
-        story.append(PageBreak())
-
-        # TOC (no automatic page numbers in this PDF)
-        story.append(Paragraph("Table of Contents (open the Word .docx to get page-numbered TOC)", subheading))
-        for line in book_data.get("toc", []):
-            story.append(Paragraph(line, normal))
-        story.append(PageBreak())
-
-        # Chapters
-        for num in sorted(book_data.get("chapters", {}).keys()):
-            title_line = book_data["toc"][num - 1] if 0 <= num - 1 < len(book_data.get("toc", [])) else f"Chapter {num}"
-            story.append(Paragraph(title_line, subheading))
-            for line in book_data["chapters"][num].splitlines():
-                if not line.strip():
-                    continue
-                story.append(Paragraph(line.strip(), normal))
-            story.append(PageBreak())
-
-        doc.build(story)
+        preface, toc, chapters = _doc_model(book)
+        out_path = _export_path(".pdf")
+        rl = _reportlab_mod()
+        doc = rl.SimpleDocTemplate(out_path, pagesize=rl.A4)
+        # one style instance per role, shared by every paragraph
+        normal = rl.ParagraphStyle("Normal", fontName="Times-Roman", fontSize=12, leading=18)
+        heading_center = rl.ParagraphStyle("HCenter", fontName="Times-Bold", fontSize=18, leading=22, alignment=1)
+        subheading = rl.ParagraphStyle("Sub", fontName="Times-Bold", fontSize=12, leading=16)
+
+        # build() needs a list; it consumes flowables from the front as pages are laid out
+        doc.build(list(_pdf_story(book, preface, toc, chapters, normal, heading_center, subheading)))
         return out_path
     except Exception as e:
         return f"Error exporting PDF: {e}\n{traceback.format_exc()}"
 
 
+def export_book_both(book: dict):
+    """Export Word and PDF concurrently from the shared document model; return both paths."""
+    _doc_model(book)  # build once up front so the two exporters share it
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        word_future = pool.submit(export_book_word, book)
+        pdf_future = pool.submit(export_book_pdf, book)
+        return [word_future.result(), pdf_future.result()]
+
+
 # --- Gradio UI ---
 
 def in_colab():
@@ -375,11 +934,14 @@ with gr.Blocks(title="AI Textbook Generator - APA Style") as demo:
     header_html = f"""
     <div style="text-align:center; margin-bottom:6px;">
         <h2 style="margin:0;">📘 AI Textbook Generator – APA Style</h2>
-        <h4 style="margin:0;">Developed by: {book_data['developer']}</h4>
+        <h4 style="margin:0;">Developed by: {DEVELOPER}</h4>
     </div>
     """
     gr.HTML(header_html)
 
+    # Per-session book store; handlers take it first and return it first when they change it
+    book_state = gr.State(new_book)
+
     with gr.Row():
         with gr.Column(scale=2):
             title_in = gr.Textbox(label="Book Title", placeholder="e.g., Introduction to Environmental Science", lines=1)
@@ -391,6 +953,7 @@ with gr.Blocks(title="AI Textbook Generator - APA Style") as demo:
             intro_out = gr.Textbox(label="Generated Preface + TOC", lines=12)
 
             gen_all_btn = gr.Button("Generate All Chapters (1..TOC)")
+            gen_all_batched_btn = gr.Button("Generate All (batched requests)")
             gen_all_out = gr.Textbox(label="Generate All Chapters Output (log)", lines=10)
 
             # Chapter generation controls
@@ -402,18 +965,25 @@ with gr.Blocks(title="AI Textbook Generator - APA Style") as demo:
             for i in range(1, 8):
                 st = gr.State(i)
                 btn = gr.Button(f"Generate Chapter {i}")
-                btn.click(fn=generate_chapter, inputs=[st], outputs=chapter_out)
+                btn.click(fn=generate_chapter, inputs=[book_state, st], outputs=[book_state, chapter_out])
                 chapter_buttons.append(btn)
                 chapter_states.append(st)
 
         with gr.Column(scale=1):
             gr.Markdown("#### Actions & Download")
-            gen_all_btn.click(fn=generate_all_chapters, inputs=[], outputs=gen_all_out)
+            gen_all_btn.click(fn=generate_all_chapters, inputs=[book_state], outputs=[book_state, gen_all_out])
+            gen_all_batched_btn.click(fn=generate_all_chapters_batched, inputs=[book_state], outputs=[book_state, gen_all_out])
             word_btn = gr.Button("Download MS Word (.docx)")
             pdf_btn = gr.Button("Download PDF (.pdf)")
+            both_btn = gr.Button("Download Both (.docx + .pdf)")
             file_out = gr.File()
-            word_btn.click(fn=export_book_word, inputs=None, outputs=file_out)
-            pdf_btn.click(fn=export_book_pdf, inputs=None, outputs=file_out)
+            files_out = gr.File(file_count="multiple", label="Word + PDF")
+            word_btn.click(fn=export_book_word, inputs=[book_state], outputs=file_out)
+            pdf_btn.click(fn=export_book_pdf, inputs=[book_state], outputs=file_out)
+            both_btn.click(fn=export_book_both, inputs=[book_state], outputs=files_out)
+            clear_cache_btn = gr.Button("Clear Model Response Cache")
+            cache_status = gr.Textbox(label="Cache status", lines=1)
+            clear_cache_btn.click(fn=clear_cache, inputs=None, outputs=cache_status)
 
             gr.Markdown("#### Notes")
             gr.Markdown("- Make sure `GROQ_API_KEY` environment variable is set to call the model.")
@@ -421,7 +991,7 @@ with gr.Blocks(title="AI Textbook Generator - APA Style") as demo:
             gr.Markdown("- If testing on Google Colab: the app will run with `share=True` automatically.")
 
     # Wire generate intro button
-    gen_intro_btn.click(fn=generate_book_intro, inputs=[title_in, grade_in, author_in, medium_in], outputs=intro_out)
+    gen_intro_btn.click(fn=generate_book_intro, inputs=[book_state, title_in, grade_in, author_in, medium_in], outputs=[book_state, intro_out])
 
 # Launch logic
 if __name__ == "__main__":